@@ -8,73 +8,215 @@ Updated for Python3 by Joe Stanley
 """
 ################################################################################
 
+import filecmp
+import json
 import os
 import sys
-from docutils.core import publish_from_doctree
 from sphinx.builders.text import TextBuilder
+from sphinx_docbook import __version__
 from sphinx_docbook.docbook_writer import DocBookWriter
 
+try:
+    import jinja2
+except ImportError:
+    # Jinja2 is only needed when a template file is configured.
+    jinja2 = None
+
+# DocBook files for large projects easily reach several megabytes; write them
+# through a bigger buffer than Python's 8 KiB default.
+_OUTPUT_BUFFER_SIZE = 1 << 18
+
+# File in the doctree directory that records which read of each document its
+# output was last written (or found unchanged) for.
+_WRITTEN_DOCS_FILENAME = 'docbook_written.json'
+
+
+def _file_sizes(directory, suffix, prefix=''):
+    """Map the name of every file below directory that ends with suffix to
+    its size in bytes.
+
+    Names are relative to directory and use '/' as separator, like Sphinx's
+    docnames, whatever the platform. os.scandir returns the stat information
+    along with the directory listing, so this avoids a separate stat call per
+    file. Hidden directories (such as Sphinx's .doctrees) and symbolic links
+    to directories are skipped."""
+    sizes = {}
+    for entry in os.scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            if not entry.name.startswith('.'):
+                sizes.update(_file_sizes(
+                    entry.path, suffix, f'{prefix}{entry.name}/'
+                ))
+        elif entry.name.endswith(suffix) and entry.is_file():
+            sizes[prefix + entry.name] = entry.stat().st_size
+    return sizes
+
+
+def _write_if_changed(path, payload, existing_size):
+    """Write the payload (bytes) to path, unless the file already holds
+    exactly that content; unchanged files keep their modification time.
+
+    existing_size is the size of the file at path, or None if there is no
+    such file. The existing file is only read when the sizes match."""
+    if existing_size == len(payload):
+        with open(path, 'rb') as existing_file:
+            if existing_file.read() == payload:
+                return
+    with open(path, 'wb', buffering=_OUTPUT_BUFFER_SIZE) as output_file:
+        output_file.write(payload)
+
+
+def _replace_if_changed(new_path, path, same_size):
+    """Move the file at new_path over path, unless both files have the same
+    content, in which case new_path is discarded and path is left as is.
+
+    The contents are only compared when same_size is true."""
+    if same_size and filecmp.cmp(new_path, path, shallow=False):
+        os.remove(new_path)
+    else:
+        os.replace(new_path, path)
+
+
 class DocBookBuilder(TextBuilder):
     """Build DocBook documents from a Sphinx doctree"""
     # pylint: disable=attribute-defined-outside-init
 
     name = 'docbook'
+    out_suffix = '.xml'
+    # Every document is translated and written independently, so Sphinx can
+    # spread write_doc over worker processes when run with -j.
+    allow_parallel = True
 
     def process_with_template(self, contents):
         """Process the results with a moustache-style template.
 
         The template variables can be specified as {{data.root_element}} and
         {{data.contents}}. You can use this to create a custom DocBook header
-        for your final output."""
+        for your final output. The rendered result is returned as UTF-8
+        encoded bytes, ready to be written to the output file."""
+        data = { 'root_element': self.root_element,
+                 'contents': contents }
+
         try:
-            import jinja2
-        except ImportError:
+            result = self._compiled_template.render(data=data).encode('utf-8')
+        except jinja2.TemplateError as err:
+            sys.stderr.write(
+                "DocBookBuilder -- "
+                f"failed to render template {self._template_full_path}: {err}\n"
+            )
+            sys.exit(1)
+
+        return result
+
+    def compile_template(self):
+        """Load and compile the configured template once per build.
+
+        The compiled template is reused for every document written, so the
+        Jinja2 environment is created without auto-reloading."""
+        if jinja2 is None:
             sys.stderr.write(
                 "DocBookBuilder -- Jinja2 is not installed: can't use template!"
                 "\n"
             )
             sys.exit(1)
 
-        full_template_path = os.path.join(
-            sphinx_app.env.srcdir,
-            sphinx_app.config.docbook_template_file
-        )
-
-        if not os.path.exists(full_template_path):
+        if not os.path.exists(self._template_full_path):
             sys.stderr.write(
                 "DocBookBuilder -- "
-                f"template file doesn't exist: {full_template_path}\n"
+                f"template file doesn't exist: {self._template_full_path}\n"
             )
             sys.exit(1)
 
-        data = { 'root_element': self.root_element,
-                 'contents': contents }
-
         jinja2env = jinja2.Environment(
-                loader=jinja2.FileSystemLoader(sphinx_app.env.srcdir),
-                trim_blocks=True)
+                loader=jinja2.FileSystemLoader(self.env.srcdir),
+                trim_blocks=True,
+                auto_reload=False,
+                cache_size=-1)
 
         try:
-            template = jinja2env.get_template(self.template_filename)
-            template.render(data=data)
-        #pylint: disable=bare-except
-        except:
+            return jinja2env.get_template(self.template_filename)
+        except jinja2.TemplateNotFound:
             sys.stderr.write(
                 "DocBookBuilder -- "
-                f"template file doesn't exist: {full_template_path}\n"
+                f"template file doesn't exist: {self._template_full_path}\n"
             )
             sys.exit(1)
-        #pylint: enable=bare-except
+        except jinja2.TemplateError as err:
+            sys.stderr.write(
+                "DocBookBuilder -- "
+                f"failed to load template {self._template_full_path}: {err}\n"
+            )
+            sys.exit(1)
+
+
+    def init(self):
+        super().init()
+        self._written_docs_path = os.path.join(
+            self.doctreedir, _WRITTEN_DOCS_FILENAME
+        )
+        try:
+            with open(self._written_docs_path, encoding='utf-8') as written:
+                self._written_docs = json.load(written)
+        except (OSError, ValueError):
+            self._written_docs = {}
 
-        return template.render(data=data)
+    def get_outdated_docs(self):
+        """Yield the documents whose output is out of date.
 
+        Output files are left untouched when their content does not change,
+        so a target can be older than its source and still be current. A
+        target counts as current if it exists and was last written for the
+        doctree the environment holds now; other documents are judged by
+        their modification times, as the text builder does."""
+        all_docs = self.env.all_docs
+        for docname in super().get_outdated_docs():
+            read_time = self._written_docs.get(docname)
+            if (read_time is not None and read_time == all_docs.get(docname)
+                    and os.path.isfile(os.path.join(
+                        self.outdir, docname + self.out_suffix))):
+                continue
+            yield docname
 
     def get_target_uri(self, docname, typ=None):
         return f'./{docname}.xml'
 
     def prepare_writing(self, docnames):
-        self.root_element = sphinx_app.config.docbook_default_root_element
-        self.template_filename = sphinx_app.config.docbook_template_file
+        self.root_element = self.config.docbook_default_root_element
+        self.template_filename = self.config.docbook_template_file
+        self._compiled_template = None
+        if self.template_filename is not None:
+            self._template_full_path = os.path.join(
+                self.env.srcdir,
+                self.template_filename
+            )
+            self._compiled_template = self.compile_template()
+
+        self._outdir = os.fspath(self.outdir) + os.sep
+        self._output_sizes = _file_sizes(self._outdir, self.out_suffix)
+
+        self._pretty_print = bool(self.config.docbook_pretty_print)
+
+        # A single writer is shared by all documents; only the document ID
+        # (and output stream) change from one document to the next.
+        self._writer = DocBookWriter(
+            root_element=self.root_element,
+            output_xml_header=(self.template_filename == None),
+            use_xml_id_in_titles=bool(
+                self.config.docbook_use_xml_id_in_titles
+            ),
+            pretty_print=self._pretty_print,
+        )
+
+    def translate(self, doctree):
+        """Translate a doctree with the shared writer and return its output.
+
+        The writer is driven directly rather than through docutils'
+        publish_from_doctree: Sphinx has already applied its transforms, so
+        setting up a Publisher (settings, transforms) per document is
+        unnecessary, just as it is for Sphinx's own builders."""
+        self._writer.document = doctree
+        self._writer.translate()
+        return self._writer.output
 
     def write_doc(self, docname, doctree):
 
@@ -83,34 +225,70 @@ class DocBookBuilder(TextBuilder):
         #(path, filename) = os.path.split(self.output_filename)
         #(doc_id, ext) = os.path.splitext(filename)
 
-        docutils_writer = DocBookWriter(
-            root_element=self.root_element,
-            document_id=docname,
-            output_xml_header=(self.template_filename == None),
-            use_xml_id_in_titles=sphinx_app.config.docbook_use_xml_id_in_titles,
-        )
+        docutils_writer = self._writer
+        docutils_writer.document_id = docname
 
-        # get the docbook output.
-        docbook_contents = publish_from_doctree(
-            doctree,
-            writer=docutils_writer
-        )
+        out_name = docname + self.out_suffix
+        out_path = self._outdir + out_name
+        existing_size = self._output_sizes.get(out_name)
 
-        # process the output with a template if a template name was supplied.
+        # without a template and without pretty printing, the docbook output
+        # is serialized while the doctree is being translated: stream it to a
+        # file next to the target, which is only replaced if its content
+        # changed.
+        if self.template_filename is None and not self._pretty_print:
+            new_path = f'{out_path}.new'
+            try:
+                with open(new_path, 'wb',
+                          buffering=_OUTPUT_BUFFER_SIZE) as output_file:
+                    docutils_writer.document = doctree
+                    docutils_writer.translate_to(output_file)
+                    new_size = output_file.tell()
+            except BaseException:
+                os.remove(new_path)
+                raise
+            _replace_if_changed(new_path, out_path, existing_size == new_size)
+            return
+
+        # otherwise the complete docbook output is built in memory anyway.
+        docbook_contents = self.translate(doctree)
+
+        # process the output with the template; templates work on text, so
+        # this is the only place the output needs to be decoded.
         if self.template_filename is not None:
-            docbook_contents = self.process_with_template(docbook_contents)
+            docbook_contents = self.process_with_template(
+                docbook_contents.decode('utf-8')
+            )
+
+        _write_if_changed(out_path, docbook_contents, existing_size)
 
-        out_path = os.path.join(self.outdir, f'{docname}.xml')
-        with open(out_path, 'w+', encoding="utf-8") as output_file:
-            output_file.write(docbook_contents.decode('utf-8'))
+    def write_doc_serialized(self, docname, doctree):
+        # Called in the main process, also for parallel builds. The record is
+        # only saved by finish, after all documents were written.
+        self._written_docs[docname] = self.env.all_docs[docname]
+
+    def finish(self):
+        super().finish()
+        all_docs = self.env.all_docs
+        written_docs = {
+            docname: read_time
+            for docname, read_time in self._written_docs.items()
+            if docname in all_docs
+        }
+        with open(self._written_docs_path, 'w', encoding='utf-8') as written:
+            json.dump(written_docs, written)
 
 
 def setup(app):
-    # pylint: disable=global-variable-undefined, invalid-name
-    global sphinx_app
-    sphinx_app = app
-    # pylint: enable=global-variable-undefined, invalid-name
     app.add_config_value('docbook_default_root_element', 'section', 'env')
     app.add_config_value('docbook_template_file', None, 'env')
     app.add_config_value('docbook_use_xml_id_in_titles', False, 'env')
+    app.add_config_value('docbook_pretty_print', True, 'env')
     app.add_builder(DocBookBuilder)
+
+    return {
+        'version': __version__,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
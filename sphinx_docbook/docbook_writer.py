@@ -8,7 +8,9 @@ Updated for Python3 by Joe Stanley
 """
 ################################################################################
 
+import functools
 import os
+import re
 import sys
 
 from docutils import nodes, writers
@@ -18,12 +20,277 @@ import lxml.etree as etree
 
 def _print_error(text, node = None):
     """Prints an error string and optionally, the node being worked on."""
-    sys.stderr.write(f'\n{__name__}: {text}\n')
+    message = f'\n{__name__}: {text}\n'
     if node:
-        sys.stderr.write(f"  {node}\n")
+        message += f"  {node}\n"
+    sys.stderr.write(message)
+
+# Problematic nodes and system messages are already reported by docutils or
+# Sphinx; they are only printed again, as are the nodes that are left out of
+# the DocBook output, when SPHINX_DOCBOOK_DEBUG is set.
+_DEBUG = bool(os.environ.get('SPHINX_DOCBOOK_DEBUG'))
 
 _NAMESPACE_ID = '{http://www.w3.org/XML/1998/namespace}id'
 
+# Control characters are not allowed in XML 1.0, except tab, LF and CR, and
+# neither are surrogates, U+FFFE and U+FFFF.
+_INVALID_XML_CHARS_RE = re.compile(
+    '[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]'
+)
+_INVALID_XML_CHARS_TABLE = {
+    i: None
+    for i in (*range(32), *range(0xd800, 0xe000), 0xfffe, 0xffff)
+    if chr(i) not in '\t\n\r'
+}
+# Longer strings are sanitized without being cached, to bound memory use.
+_SANITIZE_CACHE_MAX_LENGTH = 256
+
+
+def _strip_invalid_xml_chars(text):
+    """Remove the characters that are not allowed in XML from a string."""
+    # Most text has no invalid XML characters; only translate if needed.
+    if _INVALID_XML_CHARS_RE.search(text) is None:
+        return text
+    return text.translate(_INVALID_XML_CHARS_TABLE)
+
+
+# Short strings (names, keywords, inline literals) repeat a lot in large
+# documents, so their sanitized form is remembered.
+_strip_invalid_xml_chars_cached = functools.lru_cache(maxsize=4096)(
+    _strip_invalid_xml_chars)
+
+# Attributes of elements pushed without any. Shared, so it must not be
+# modified.
+_EMPTY = {}
+
+# Titles of Sphinx's versionmodified notes, by version type.
+_VERSION_TYPE_LABELS = {
+    'versionadded': 'New in version',
+    'versionchanged': 'Changed in version',
+    'deprecated': 'Deprecated since version',
+    'versionremoved': 'Removed in version',
+}
+
+# Returned by a visit_* method to skip the node's children and departure.
+# This has the effect of raising nodes.SkipNode, without the exception.
+_SKIP_NODE = object()
+
+# Namespaces declared on the root element of every DocBook document. The same
+# dict is shared by all translators and must not be modified. (lxml orders the
+# declarations differently for other mapping types, so it stays a dict.)
+_NSMAP = {
+    'xml': 'http://www.w3.org/XML/1998/namespace',
+    'xlink': 'http://www.w3.org/1999/xlink',
+    'xi': 'http://www.w3.org/2001/XInclude',
+    'svg': 'http://www.w3.org/2000/svg',
+    'xhtml': 'http://www.w3.org/1999/xhtml',
+    'mathml': 'http://www.w3.org/1998/Math/MathML',
+    None: 'http://docbook.org/ns/docbook'
+}
+
+# The XML declaration written before the root element, spelled the way
+# `lxml.etree.tostring` spells it.
+_XML_DECLARATION = "<?xml version='1.0' encoding='utf-8' standalone='yes'?>\n"
+
+
+class _SubElementTreeBuilder:
+    """
+    A replacement for `lxml.etree.TreeBuilder` that creates elements with
+    `etree.SubElement`, so that only the root element is created with the
+    namespace map and its children inherit the namespace context.
+
+    As with TreeBuilder, if several top-level elements are built, the last
+    one is returned by `close`.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._current = None
+        self._parents = []
+        # The element that was closed last within the current element; text
+        # that follows it belongs in its tail.
+        self._last_closed = None
+
+    def start(self, tag, attrib, nsmap=None):
+        if self._current is None:
+            element = etree.Element(tag, attrib, nsmap)
+            self._root = element
+        else:
+            element = etree.SubElement(self._current, tag, attrib)
+        self._parents.append(self._current)
+        self._current = element
+        self._last_closed = None
+        return element
+
+    def end(self, tag):
+        element = self._current
+        self._current = self._parents.pop()
+        self._last_closed = element
+        return element
+
+    def data(self, text):
+        if self._current is None:
+            # Text outside of the root element is dropped.
+            return
+        last_closed = self._last_closed
+        if last_closed is not None:
+            last_closed.tail = (last_closed.tail or '') + text
+        else:
+            current = self._current
+            current.text = (current.text or '') + text
+
+    def close(self):
+        return self._root
+
+
+def _escape_xml_text(text):
+    """Escape text for use as XML character data, as lxml does."""
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('\r', '&#13;'))
+
+
+def _escape_xml_attribute(value):
+    """Escape text for use as a (double quoted) XML attribute value, as
+    lxml does."""
+    return (_escape_xml_text(value).replace('"', '&quot;')
+            .replace('\n', '&#10;').replace('\t', '&#9;'))
+
+
+def _strip_extension(uri):
+    """Drop the file extension from uri, as posixpath.splitext would.
+
+    The last dot in the file name starts the extension, unless only dots
+    come before it (as in '.foo' or '..foo')."""
+    start = uri.rfind('/') + 1
+    dot = uri.rfind('.')
+    if dot > start and uri.count('.', start, dot) != dot - start:
+        return uri[:dot]
+    return uri
+
+
+class _SerializingTreeBuilder:
+    """
+    A stand-in for `lxml.etree.TreeBuilder` that serializes elements to a
+    file as they are started and ended, writing the markup itself instead of
+    going through lxml objects.
+
+    The output matches lxml's serialization of the same tree without pretty
+    printing, including empty element tags. Namespaces are declared on the
+    root element, which must be given the namespace map. As with
+    `_SubElementTreeBuilder`, if several top-level elements are built, only
+    the last one is kept.
+
+    Parameters
+    ----------
+    output:             file-like
+                        Binary file object that receives the DocBook output.
+    output_xml_header:  bool, optional
+                        Write the XML declaration first (default).
+    """
+
+    # Number of pending markup fragments that triggers a write to the output.
+    _FLUSH_THRESHOLD = 4096
+
+    def __init__(self, output, output_xml_header: bool = True):
+        self._output = output
+        self._parts = []
+        if output_xml_header:
+            self._parts.append(_XML_DECLARATION)
+        self._depth = 0
+        self._root_written = False
+        # Seekable outputs are written in batches, and a top-level element
+        # that is followed by another one is cut off again. Anything else is
+        # only written on close, so that the element can still be dropped.
+        seekable = getattr(output, 'seekable', None)
+        self._seekable = bool(seekable and seekable())
+        # Where the current top-level element starts, in the output or in
+        # the pending parts.
+        self._root_offset = 0
+        self._root_part = 0
+        # Whether the last start tag is still missing its '>', so that the
+        # element can be closed as an empty element tag.
+        self._tag_open = False
+        self._prefixes = {_NSMAP['xml']: 'xml'}
+        # Qualified names by '{namespace}local' names.
+        self._qnames = {}
+
+    def _qname(self, name):
+        qname = self._qnames.get(name)
+        if qname is None:
+            qname = name
+            if name[0] == '{':
+                uri, local = name[1:].split('}', 1)
+                prefix = self._prefixes[uri]
+                qname = f'{prefix}:{local}' if prefix else local
+            self._qnames[name] = qname
+        return qname
+
+    def _flush(self):
+        self._output.write(''.join(self._parts).encode('utf-8'))
+        self._parts.clear()
+
+    def _start_root(self):
+        if self._root_written:
+            # Drop the previous top-level element.
+            if self._seekable:
+                self._flush()
+                self._output.seek(self._root_offset)
+                self._output.truncate()
+            else:
+                del self._parts[self._root_part:]
+        if self._seekable:
+            self._flush()
+            self._root_offset = self._output.tell()
+        else:
+            self._root_part = len(self._parts)
+
+    def start(self, tag, attrib, nsmap=None):
+        if not self._depth:
+            self._start_root()
+        parts = self._parts
+        if self._tag_open:
+            parts.append('>')
+        namespaces = ''
+        if nsmap and not self._depth:
+            for prefix, uri in nsmap.items():
+                if prefix == 'xml':
+                    continue
+                self._prefixes[uri] = prefix
+                if prefix:
+                    namespaces += f' xmlns:{prefix}="{_escape_xml_attribute(uri)}"'
+                else:
+                    namespaces += f' xmlns="{_escape_xml_attribute(uri)}"'
+        parts.append('<' + self._qname(tag) + namespaces)
+        for name, value in attrib.items():
+            parts.append(
+                f' {self._qname(name)}="{_escape_xml_attribute(value)}"'
+            )
+        self._depth += 1
+        self._tag_open = True
+
+    def end(self, tag):
+        if self._tag_open:
+            self._parts.append('/>')
+            self._tag_open = False
+        else:
+            self._parts.append('</' + self._qname(tag) + '>')
+        self._depth -= 1
+        if not self._depth:
+            self._root_written = True
+        if self._seekable and len(self._parts) >= self._FLUSH_THRESHOLD:
+            self._flush()
+
+    def data(self, text):
+        if self._depth:
+            if self._tag_open:
+                self._parts.append('>')
+                self._tag_open = False
+            self._parts.append(_escape_xml_text(text))
+
+    def close(self):
+        self._flush()
+
+
 class DocBookWriter(writers.Writer):
     """
     A docutils writer for DocBook.
@@ -36,6 +303,14 @@ class DocBookWriter(writers.Writer):
                         Identifying name of the document.
     output_xml_header:  bool, optional
                         Use the builtin XML header information (default).
+    stream:             file-like, optional
+                        Binary file object to write the DocBook output to.
+                        Pretty-printed output is built in memory and then
+                        written to it by lxml. Otherwise, the output is
+                        serialized as the document is translated; a file that
+                        cannot seek only receives it once the document is
+                        done. When supplied, the writer's output is left
+                        empty.
     kwargs:             dict[str, str], optional
                         Dictionary of additional controls for adjusting XML
                         generation.
@@ -47,6 +322,7 @@ class DocBookWriter(writers.Writer):
         root_element: str,
         document_id: str = None,
         output_xml_header: bool = True,
+        stream=None,
         **kwargs,
     ):
         """Initialize the writer. Takes the root element of the resulting
@@ -55,6 +331,7 @@ class DocBookWriter(writers.Writer):
         self.document_type = root_element
         self.document_id = document_id
         self.output_xml_header = output_xml_header
+        self.stream = stream
         self._kwargs = kwargs
 
     def translate(self):
@@ -64,24 +341,163 @@ class DocBookWriter(writers.Writer):
             self.document_type,
             self.document_id,
             self.output_xml_header,
+            stream=self.stream,
             **self._kwargs,
         )
-        self.document.walkabout(self.visitor)
+        self.visitor.walkabout(self.document)
         self.output = self.visitor.astext()
         self.fields = self.visitor.fields
 
+    def translate_to(self, fileobj):
+        """Translate the document, writing the DocBook output to the
+        binary file object fileobj.
+
+        This is what the stream argument does, for a single document: the
+        writer's stream is restored afterwards."""
+        stream = self.stream
+        self.stream = fileobj
+        try:
+            self.translate()
+        finally:
+            self.stream = stream
+
+
+def _noop(self, node):
+    """visit_/depart_ method for nodes that need no handling. The
+    translator's dispatch methods skip calling it."""
 
+
+def _add_simple_visitors(cls):
+    """Class decorator that adds a visit_/depart_ method pair for each node
+    in cls._SIMPLE_TAGS, which just wraps the node's contents in the given
+    DocBook element, and for each node in cls._ADMONITIONS, which does the
+    same and adds the given title. Methods defined in the class itself are
+    kept."""
+
+    def depart_simple(self, node):
+        self._pop_element()
+
+    def make_visit(tag, title = None):
+        if title is None:
+            def visit_simple(self, node):
+                self._push_element(tag)
+        else:
+            def visit_simple(self, node):
+                self._push_element_with_title(tag, title)
+        return visit_simple
+
+    visitors = {
+        node_name: make_visit(tag)
+        for node_name, tag in cls._SIMPLE_TAGS.items()
+    }
+    for node_name, (tag, title) in cls._ADMONITIONS.items():
+        visitors[node_name] = make_visit(tag, title)
+
+    for node_name, visit in visitors.items():
+        for name, method in (('visit_' + node_name, visit),
+                             ('depart_' + node_name, depart_simple)):
+            if name not in vars(cls):
+                setattr(cls, name, method)
+    return cls
+
+
+@_add_simple_visitors
 class DocBookTranslator(nodes.NodeVisitor):
     """A docutils translator for DocBook."""
     # pylint: disable=missing-function-docstring, unnecessary-pass
     # pylint: disable=unused-argument
 
+    # NodeVisitor has no __slots__, so instances keep a __dict__ (for
+    # attributes such as NodeVisitor's document); the translator's own state
+    # lives in slots.
+    __slots__ = (
+        'settings', 'content', 'document_type', 'document_id',
+        'in_first_section', 'output_xml_header', '_kwargs',
+        'use_xml_id_in_titles', 'pretty_print', 'in_pre_block', 'in_figure',
+        'in_glossary', 'next_element_id', 'description_type',
+        '_auto_summary_node', '_reference_links', 'estack', 'stream', 'tb',
+        '_text_buf', 'fields', 'current_field_name', 'nsmap',
+        '_visit_methods', '_depart_methods', '_tb_start', '_tb_end',
+        '_tb_data', '_estack_push', '_estack_pop',
+    )
+
+    # visit_*/depart_* functions by node class, looked up once per
+    # translator class and shared by all of its instances.
+    _visit_cache = {}
+    _depart_cache = {}
+
+    # Nodes that are translated to a single DocBook element holding their
+    # contents, by node name.
+    _SIMPLE_TAGS = {
+        # document parts
+        'block_quote': 'blockquote',
+        'abstract': 'abstract',
+        'desc_parameter': 'varlistentry',
+        'literal_emphasis': 'literal_emphasis',
+        'doctest_block': 'doctest_block',
+        'seealso': 'seealso',
+        'option_list': 'option_list',
+        'option_list_item': 'option_list_item',
+        'option_group': 'option_group',
+        'option_string': 'option_string',
+        'option': 'option',
+        'option_argument': 'option_argument',
+        'description': 'description',
+        'literal_strong': 'command',
+        'subtitle': 'subtitle',
+        'title_reference': 'citetitle',
+        'titleabbrev': 'titleabbrev',
+        # list parts
+        'bullet_list': 'itemizedlist',
+        'enumerated_list': 'orderedlist',
+        'list_item': 'listitem',
+        # table parts
+        'table': 'table',
+        'thead': 'thead',
+        'row': 'row',
+        'entry': 'entry',
+        'tbody': 'tbody',
+        # character formatting
+        'emphasis': 'emphasis',
+        'subscript': 'subscript',
+        'superscript': 'superscript',
+        # code and such
+        'literal': 'code',
+        # 'see' and 'see also' references in glossary entries
+        'glossary_see': 'glosssee',
+        'glossary_seealso': 'glossseealso',
+    }
+
+    # Admonitions by node name: the DocBook element they are translated to
+    # and the title added to it, if any. Generic admonitions use the 'note'
+    # conventions and take their title from the document.
+    _ADMONITIONS = {
+        'admonition': ('note', None),
+        'attention': ('important', 'Attention'),
+        'caution': ('caution', None),
+        'danger': ('warning', 'Danger'),
+        'error': ('important', 'Error'),
+        'hint': ('tip', 'Hint'),
+        'important': ('important', None),
+        'note': ('note', None),
+        'tip': ('tip', None),
+        'warning': ('warning', None),
+    }
+
+    # Bibliographic fields that are written to the document's info element,
+    # by field name: the nested DocBook elements holding the field's value.
+    _FIELD_ELEMENTS = {
+        'author': ('author', 'personname'),
+        'date': ('pubdate',),
+    }
+
     def __init__(
         self,
         document,
         document_type: str,
         document_id: str = None,
         output_xml_header: bool = True,
+        stream=None,
         **kwargs,
     ):
         """Initialize the translator. Takes the root element of the resulting
@@ -94,6 +510,10 @@ class DocBookTranslator(nodes.NodeVisitor):
         self.in_first_section = False
         self.output_xml_header = output_xml_header
         self._kwargs = kwargs
+        self.use_xml_id_in_titles = bool(
+            kwargs.get("use_xml_id_in_titles", False)
+        )
+        self.pretty_print = bool(kwargs.get("pretty_print", True))
 
         self.in_pre_block = False
         self.in_figure = False
@@ -102,122 +522,277 @@ class DocBookTranslator(nodes.NodeVisitor):
 
         self.description_type = None
         self._auto_summary_node = None
+        # For each reference being visited, whether a link was pushed for it.
+        self._reference_links = []
 
-        # self.estack is a stack of etree nodes. The bottom of the stack should
-        # always be the base element (the document). The top of the stack is
-        # the element currently being processed.
+        # self.estack is a stack of open element names. The bottom of the
+        # stack should always be the base element (the document). The top of
+        # the stack is the element currently being processed.
         self.estack = []
-        self.tb = etree.TreeBuilder()
+        self.stream = stream
+        if stream is None or self.pretty_print:
+            # Pretty printing needs the complete tree; astext writes it to
+            # the stream, if any.
+            self.tb = _SubElementTreeBuilder()
+        else:
+            self.tb = _SerializingTreeBuilder(stream, output_xml_header)
+        # Bound methods used for every element, looked up once.
+        self._tb_start = self.tb.start
+        self._tb_end = self.tb.end
+        self._tb_data = self.tb.data
+        self._estack_push = self.estack.append
+        self._estack_pop = self.estack.pop
+        # Text is collected here and handed to the tree builder in one piece
+        # when the next element starts or ends.
+        self._text_buf = []
         self.fields = {}
         self.current_field_name = None
-        self.nsmap = {
-            'xml': 'http://www.w3.org/XML/1998/namespace',
-            'xlink': 'http://www.w3.org/1999/xlink',
-            'xi': 'http://www.w3.org/2001/XInclude',
-            'svg': 'http://www.w3.org/2000/svg',
-            'xhtml': 'http://www.w3.org/1999/xhtml',
-            'mathml': 'http://www.w3.org/1998/Math/MathML',
-            None: 'http://docbook.org/ns/docbook'
-        }
-
-        self.SkipNode = nodes.SkipNode
+        self.nsmap = _NSMAP
+
+        # Bound visit_/depart_ methods by node class, for this translator.
+        self._visit_methods = {}
+        self._depart_methods = {}
 
     #
     # functions used by the translator.
     #
 
+    def walkabout(self, node):
+        """Traverse the tree rooted at node like docutils' Node.walkabout,
+        calling the visit_*/depart_* methods, but with an explicit stack
+        instead of recursion.
+
+        A visit_* method may return _SKIP_NODE to skip the node's children
+        and departure. The docutils traversal exceptions (SkipNode,
+        SkipChildren, SkipDeparture, SkipSiblings and StopTraversal) are
+        handled as they are by Node.walkabout."""
+        dispatch_visit = self._dispatch_visit
+        dispatch_departure = self.dispatch_departure
+        # Each entry holds a node whose children are being walked, an
+        # iterator over a copy of those children and whether the node is to
+        # be departed once they are done.
+        stack = [(None, iter((node,)), False)]
+        while stack:
+            parent, children, call_depart = stack[-1]
+            for child in children:
+                try:
+                    if dispatch_visit(child) is _SKIP_NODE:
+                        continue
+                except nodes.SkipNode:
+                    continue
+                except nodes.SkipChildren:
+                    dispatch_departure(child)
+                    continue
+                except nodes.SkipDeparture:
+                    stack.append((child, iter(child.children[:]), False))
+                    break
+                except nodes.SkipSiblings:
+                    # The node itself is not departed, but its parent is.
+                    stack[-1] = (parent, iter(()), call_depart)
+                    break
+                except nodes.StopTraversal:
+                    dispatch_departure(child)
+                    for parent, children, call_depart in reversed(stack):
+                        if call_depart:
+                            dispatch_departure(parent)
+                    return
+                if child.children:
+                    stack.append((child, iter(child.children[:]), True))
+                    break
+                dispatch_departure(child)
+            else:
+                stack.pop()
+                if call_depart:
+                    dispatch_departure(parent)
+
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Subclasses may define other methods, so they get their own caches.
+        cls._visit_cache = {}
+        cls._depart_cache = {}
+
+
+    def dispatch_visit(self, node):
+        """Call the visit_* method for node, as docutils' NodeVisitor does.
+
+        Used when the translator is driven by docutils' own Node.walkabout,
+        which does not know _SKIP_NODE: it is turned into nodes.SkipNode."""
+        result = self._dispatch_visit(node)
+        if result is _SKIP_NODE:
+            raise nodes.SkipNode
+        return result
+
+
+    def _bind(self, functions, prefix, fallback, cls):
+        """Return the visit_/depart_ (prefix) method for the node class cls
+        bound to this translator, or _noop if there is nothing to call.
+
+        The function is looked up once per translator class and kept in
+        functions; fallback is used if the class has no such method."""
+        function = functions.get(cls)
+        if function is None:
+            function = getattr(type(self), prefix + cls.__name__, fallback)
+            functions[cls] = function
+        if function is _noop:
+            return _noop
+        return function.__get__(self)
+
+
+    def _dispatch_visit(self, node):
+        cls = type(node)
+        method = self._visit_methods.get(cls)
+        if method is None:
+            method = self._bind(self._visit_cache, 'visit_',
+                    type(self).unknown_visit, cls)
+            self._visit_methods[cls] = method
+        if method is not _noop:
+            return method(node)
+        return None
+
+
+    def dispatch_departure(self, node):
+        cls = type(node)
+        method = self._depart_methods.get(cls)
+        if method is None:
+            method = self._bind(self._depart_cache, 'depart_',
+                    type(self).unknown_departure, cls)
+            self._depart_methods[cls] = method
+        if method is not _noop:
+            return method(node)
+        return None
+
+
     def astext(self):
-        doc = self.tb.close()
-        et = etree.ElementTree(doc)
+        self._flush_text()
+        if self.stream is not None and not self.pretty_print:
+            # Everything has already been written to the stream.
+            self.tb.close()
+            return None
+        root = self.tb.close()
+        if self.stream is None:
+            header = bool(self.output_xml_header)
+            return etree.tostring(root, encoding="utf-8",
+                    xml_declaration=header,
+                    standalone=True if header else None,
+                    pretty_print=self.pretty_print)
+        # Let lxml serialize the tree straight into the stream. It would spell
+        # the encoding in upper case in the declaration, so that is written
+        # separately.
         if self.output_xml_header:
-            rep = etree.tostring(et, encoding="utf-8", standalone=True,
-                    pretty_print=True)
-        else:
-            rep = etree.tostring(et, encoding="utf-8", pretty_print=True)
-        return rep
+            self.stream.write(_XML_DECLARATION.encode('utf-8'))
+        etree.ElementTree(root).write(self.stream, encoding="utf-8",
+                xml_declaration=False, pretty_print=self.pretty_print)
+        return None
 
 
     def _sanitize_xml_text(self, text):
         """Sanitize text content for XML compatibility."""
         if text is None:
             return ''
-        
-        text_str = str(text)
-        
-        # Check if text contains invalid XML characters
-        if '\x00' in text_str or any(ord(c) < 32 and c not in '\t\n\r' for c in text_str):
-            # print(f"DEBUG: Found invalid XML characters in text: {repr(text_str)}")
-            # Remove or replace invalid characters
-            sanitized = ''.join(c if ord(c) >= 32 or c in '\t\n\r' else '' for c in text_str if c != '\x00')
-            # print(f"DEBUG: Sanitized text: {repr(sanitized)}")
-            return sanitized
-        
-        return text_str
+
+        text_str = text if type(text) is str else str(text)
+
+        if len(text_str) <= _SANITIZE_CACHE_MAX_LENGTH:
+            return _strip_invalid_xml_chars_cached(text_str)
+        if text_str.isascii():
+            # For long ASCII text, a single translate pass is quicker than
+            # searching first; for other text it is much slower.
+            return text_str.translate(_INVALID_XML_CHARS_TABLE)
+        return _strip_invalid_xml_chars(text_str)
 
     def _add_element_title(self, title_name, title_attribs = None):
         """Add a title to the current element."""
-        if title_attribs is None:
-            title_attribs = {}
         self._push_element('title', title_attribs)
         sanitized_title = self._sanitize_xml_text(title_name)
-        self.tb.data(sanitized_title)
+        self._text_buf.append(sanitized_title)
         return self._pop_element()
 
 
+    def _push_element_with_title(self, name, title, attribs = None):
+        """Push an element and add a title to it.
+
+        The title is written straight to the tree builder: the text buffer
+        is empty once the element has been pushed, and the title element is
+        closed again right away, so it never goes on the element stack."""
+        e = self._push_element(name, attribs)
+        self._tb_start('title', _EMPTY)
+        self._tb_data(self._sanitize_xml_text(title))
+        self._tb_end('title')
+        return e
+
+
+    def _flush_text(self):
+        text_buf = self._text_buf
+        if text_buf:
+            self._tb_data(''.join(text_buf))
+            text_buf.clear()
+
+
     def _push_element(self, name, attribs = None):
-        if attribs is None:
-            attribs = {}
+        self._flush_text()
         if self.next_element_id:
-            attribs[
-                '{http://www.w3.org/XML/1998/namespace}id'
-            ] = self.next_element_id
+            if attribs is None:
+                attribs = {}
+            attribs[_NAMESPACE_ID] = self.next_element_id
             self.next_element_id = None
-        elif (('{http://www.w3.org/XML/1998/namespace}id' in attribs) and
-            (attribs['{http://www.w3.org/XML/1998/namespace}id'] is None)):
-            del attribs['{http://www.w3.org/XML/1998/namespace}id']
-        try:
-            e = self.tb.start(name, attribs, self.nsmap)
-        except Exception as err:
-            raise err
-        self.estack.append(e)
+        elif attribs is None:
+            attribs = _EMPTY
+        elif ((_NAMESPACE_ID in attribs) and
+            (attribs[_NAMESPACE_ID] is None)):
+            del attribs[_NAMESPACE_ID]
+        if self.estack:
+            # Child elements inherit the namespaces declared on the root.
+            e = self._tb_start(name, attribs)
+        else:
+            e = self._tb_start(name, attribs, self.nsmap)
+        self._estack_push(name)
         return e
 
 
+    def _push_with_id(self, name, node, fallback = None):
+        """Push an element, giving it the pending element ID, the node's
+        first ID or, failing both, the fallback ID (if any)."""
+        element_id = self.next_element_id
+        if element_id:
+            self.next_element_id = None
+        else:
+            ids = node['ids']
+            element_id = ids[0] if ids else fallback
+        if element_id:
+            return self._push_element(name, {_NAMESPACE_ID: element_id})
+        return self._push_element(name)
+
+
     def _pop_element(self):
-        e = self.estack.pop()
-        try:
-            return self.tb.end(str(e.tag))
-        except ValueError as err:
-            message = (
-                f"{str(err)}\nTag Information: "
-                f"{e.tag} :: {type(e.tag)} :: {len(e.tag)}"
-            )
-            raise ValueError(message) from err
+        self._flush_text()
+        # The stack holds the tag names given to _push_element, so they can
+        # be handed back to the tree builder as they are.
+        return self._tb_end(self._estack_pop())
 
 
     #
     # The document itself
     #
 
-    def visit_document(self, node):
-        """Create the document itself."""
-        pass
+    visit_document = _noop
 
 
-    def depart_document(self, node):
-        pass
+    depart_document = _noop
 
     #
     # document parts
     #
 
     def visit_Text(self, node):
-        sanitized_text = self._sanitize_xml_text(node)
-        self.tb.data(sanitized_text)
+        if node.isascii() and node.isprintable():
+            # Printable ASCII text has nothing to sanitize.
+            self._text_buf.append(node)
+        else:
+            self._text_buf.append(self._sanitize_xml_text(node))
 
 
-    def depart_Text(self, node):
-        pass
+    depart_Text = _noop
 
     def visit_paragraph(self, node):
         if self.current_field_name is None:
@@ -226,11 +801,7 @@ class DocBookTranslator(nodes.NodeVisitor):
 
     def depart_paragraph(self, node):
         if self.current_field_name is None:
-            try:
-                self._pop_element()
-            except ValueError as err:
-                print(node)
-                raise err
+            self._pop_element()
 
     def visit_compact_paragraph(self, node):
         self.visit_paragraph(node)
@@ -241,7 +812,6 @@ class DocBookTranslator(nodes.NodeVisitor):
 
 
     def visit_section(self, node):
-        attribs = {}
         # Do something special if this is the very first section in the
         # document.
         if self.in_first_section == False:
@@ -249,7 +819,7 @@ class DocBookTranslator(nodes.NodeVisitor):
             self._push_element(
                 self.document_type,
                 {
-                    '{http://www.w3.org/XML/1998/namespace}id': self.document_id,
+                    _NAMESPACE_ID: self.document_id,
                     'version': '5.0'
                 }
             )
@@ -258,17 +828,7 @@ class DocBookTranslator(nodes.NodeVisitor):
 
         if self.next_element_id:
             node['ids'][0] = self.next_element_id
-            attribs[
-                '{http://www.w3.org/XML/1998/namespace}id'
-            ] = self.next_element_id
-            self.next_element_id = None
-        else:
-            if len(node['ids']) > 0:
-                attribs[
-                    '{http://www.w3.org/XML/1998/namespace}id'
-                ] = node['ids'][0]
-
-        self._push_element('section', attribs)
+        self._push_with_id('section', node)
         # TODO - Collect other attributes.
 
 
@@ -276,45 +836,16 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()
 
 
-    def visit_block_quote(self, node):
-        self._push_element('blockquote')
-
-
-    def depart_block_quote(self, node):
-        self._pop_element()
-
-
-
-    def visit_abstract(self, node):
-        self._push_element('abstract')
-
-
-    def depart_abstract(self, node):
-        self._pop_element()
-
-
     def visit_desc(self, node):
-        attribs = {}
         self.description_type = node.get("desctype")
-        next_node = node.next_node()
+        # The first child is the signature; its ID is used if the description
+        # has none.
+        signature = node.children[0] if node.children else None
+        next_ids = signature['ids'] if signature is not None else None
 
         if self.next_element_id:
             node['ids'][0] = self.next_element_id
-            attribs[
-                '{http://www.w3.org/XML/1998/namespace}id'
-            ] = self.next_element_id
-            self.next_element_id = None
-        else:
-            if len(node['ids']) > 0:
-                attribs[
-                    '{http://www.w3.org/XML/1998/namespace}id'
-                ] = node['ids'][0]
-            elif len(next_node['ids']) > 0:
-                attribs[
-                    '{http://www.w3.org/XML/1998/namespace}id'
-                ] = next_node['ids'][0]
-
-        self._push_element('section', attribs=attribs)
+        self._push_with_id('section', node, next_ids[0] if next_ids else None)
 
 
     def depart_desc(self, node):
@@ -324,47 +855,42 @@ class DocBookTranslator(nodes.NodeVisitor):
             self._auto_summary_node = None
         self._pop_element()
 
-    def visit_desc_signature(self, node):
-        #self._push_element('desc_signature')
-        pass
+    visit_desc_signature = _noop
 
-    def depart_desc_signature(self, node):
-        #self._pop_element()
-        pass
+    depart_desc_signature = _noop
 
 
     def visit_desc_annotation(self, node):
         # ignore description annotation in the output.
         #self._push_element('desc_annotation')
-        _print_error("ignoring description annotation:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring description annotation:", node)
+        return _SKIP_NODE
 
-    def depart_desc_annotation(self, node):
-        #self._pop_element()
-        pass
+    depart_desc_annotation = _noop
 
 
     def visit_desc_addname(self, node):
         # ignore description addname in the output.
         #self._push_element('desc_addname')
-        _print_error("ignoring description addname:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring description addname:", node)
+        return _SKIP_NODE
 
-    def depart_desc_addname(self, node):
-        #self._pop_element()
-        pass
+    depart_desc_addname = _noop
 
 
     def visit_desc_name(self, node):
-        if isinstance(self.description_type, str):
-            next_node = str(node.next_node())
-            node.pop()
-            # Sanitize the text before creating the Text node
-            sanitized_text = self._sanitize_xml_text(f"{next_node} ({self.description_type.title()})")
-            node.append(
-                nodes.Text(sanitized_text)
-            )
         self.visit_title(node=node)
+        if isinstance(self.description_type, str):
+            # Write the name followed by the description type as the title
+            # text, rather than rewriting the doctree and walking the name.
+            name = node.children[0] if node.children else None
+            self._text_buf.append(self._sanitize_xml_text(
+                f"{name} ({self.description_type.title()})"
+            ))
+            self.depart_desc_name(node)
+            return _SKIP_NODE
 
     def depart_desc_name(self, node):
         self.description_type = None # Reset
@@ -372,14 +898,14 @@ class DocBookTranslator(nodes.NodeVisitor):
 
 
     def visit_desc_parameterlist(self, node):
-        attribs = {}
-        if len(node['ids']) > 0:
-            attribs[_NAMESPACE_ID] = node['ids'][0]
-        elif len(node.parent['ids']) > 0:
-            # If the parent node has an ID, we can use that and add
-            # '.title' at the end to make a deterministic title ID.
-            attribs[_NAMESPACE_ID] = f"{node.parent['ids'][0]}.parameters"
-        self._push_element('section', attribs=attribs)
+        # If the parent node has an ID, we can use that and add
+        # '.parameters' at the end to make a deterministic section ID.
+        parent_ids = node.parent['ids']
+        self._push_with_id(
+            'section',
+            node,
+            f"{parent_ids[0]}.parameters" if parent_ids else None
+        )
         # Add the Title to the Parameter List
         self.visit_title(node=node)
         self.visit_Text(node=nodes.Text("Constructor Parameters"))
@@ -391,57 +917,38 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()
 
 
-    def visit_desc_parameter(self, node):
-        self._push_element('varlistentry')
+    visit_desc_content = _noop
 
-    def depart_desc_parameter(self, node):
-        self._pop_element()
-
-
-    def visit_desc_content(self, node):
-        #self._push_element('desc_content')
-        pass
-
-    def depart_desc_content(self, node):
-        #self._pop_element()
-        pass
-
-
-    def visit_literal_emphasis(self, node):
-        self._push_element('literal_emphasis')
-
-    def depart_literal_emphasis(self, node):
-        self._pop_element()
+    depart_desc_content = _noop
 
 
     def visit_rubric(self, node):
-        _print_error("ignoring rubric:", node)
-        raise nodes.SkipNode
-
-    def depart_rubric(self, node):
-        pass
+        if _DEBUG:
+            _print_error("ignoring rubric:", node)
+        return _SKIP_NODE
 
-
-    def visit_doctest_block(self, node):
-        self._push_element('doctest_block')
-
-    def depart_doctest_block(self, node):
-        self._pop_element()
+    depart_rubric = _noop
 
 
     def visit_tabular_col_spec(self, node):
-        _print_error("ignoring tabular column spec:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring tabular column spec:", node)
+        return _SKIP_NODE
         #self._push_element('tabular_col_spec')
 
-    def depart_tabular_col_spec(self, node):
-        pass
+    depart_tabular_col_spec = _noop
 
 
     def visit_autosummary_table(self, node):
         self.visit_section(node)
-        rubric = node.previous_sibling().previous_sibling()
-        text = rubric.next_node()
+        # The rubric naming the table comes two nodes before it.
+        siblings = node.parent.children
+        index = siblings.index(node)
+        if index < 2:
+            _print_error('no rubric for autosummary table', node)
+            return
+        rubric = siblings[index - 2]
+        text = rubric.children[0]
         self.visit_title(node=rubric)
         self.visit_Text(text)
         self.depart_Text(text)
@@ -455,62 +962,6 @@ class DocBookTranslator(nodes.NodeVisitor):
             self._auto_summary_node = node
 
 
-    def visit_seealso(self, node):
-        self._push_element('seealso')
-
-    def depart_seealso(self, node):
-        self._pop_element()
-
-
-    def visit_option_list(self, node):
-        self._push_element('option_list')
-
-    def depart_option_list(self, node):
-        self._pop_element()
-
-
-    def visit_option_list_item(self, node):
-        self._push_element('option_list_item')
-
-    def depart_option_list_item(self, node):
-        self._pop_element()
-
-
-    def visit_option_group(self, node):
-        self._push_element('option_group')
-
-    def depart_option_group(self, node):
-        self._pop_element()
-
-
-    def visit_option_string(self, node):
-        self._push_element('option_string')
-
-    def depart_option_string(self, node):
-        self._pop_element()
-
-
-    def visit_option(self, node):
-        self._push_element('option')
-
-    def depart_option(self, node):
-        self._pop_element()
-
-
-    def visit_option_argument(self, node):
-        self._push_element('option_argument')
-
-    def depart_option_argument(self, node):
-        self._pop_element()
-
-
-    def visit_description(self, node):
-        self._push_element('description')
-
-    def depart_description(self, node):
-        self._pop_element()
-
-
     def visit_address(self, node):
         self.visit_literal_block(node)
 
@@ -534,13 +985,9 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()
 
 
-    def visit_line(self, node):
-        """Visit a line node within a line block.
-        
-        Each line in a line block is represented as a separate line node.
-        We don't need to create additional elements, just let the content flow.
-        """
-        pass
+    # Each line in a line block is represented as a separate line node.
+    # We don't need to create additional elements, just let the content flow.
+    visit_line = _noop
 
 
     def depart_line(self, node):
@@ -549,37 +996,34 @@ class DocBookTranslator(nodes.NodeVisitor):
         Add a line break after each line except the last one.
         """
         # Check if this is not the last line in the line block
-        if node.parent and hasattr(node, 'parent'):
-            parent_children = list(node.parent.children)
-            if parent_children and node is not parent_children[-1]:
-                # Add a line break after this line (except for the last line)
-                self.tb.data('\n')
+        parent = node.parent
+        if parent is not None and parent.children[-1] is not node:
+            # Add a line break after this line (except for the last line)
+            self._text_buf.append('\n')
 
 
     def visit_download_reference(self, node):
         # ignore comments in the output.
-        _print_error("ignoring download reference:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring download reference:", node)
+        return _SKIP_NODE
 
 
-    def depart_download_reference(self, node):
-        pass
+    depart_download_reference = _noop
 
 
     def visit_comment(self, node):
         # ignore comments in the output.
-        _print_error("ignoring comment:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring comment:", node)
+        return _SKIP_NODE
 
-    def depart_comment(self, node):
-        pass
+    depart_comment = _noop
 
-    def visit_compound(self, node):
-        pass
+    visit_compound = _noop
 
 
-    def depart_compound(self, node):
-        pass
+    depart_compound = _noop
 
 
     def visit_docinfo(self, node):
@@ -587,30 +1031,17 @@ class DocBookTranslator(nodes.NodeVisitor):
         pass
 
 
-    def depart_docinfo(self, node):
-        pass
+    depart_docinfo = _noop
 
 
     def visit_include(self, node):
         """Include as an xi:include"""
 
 
-    def visit_index(self, node):
-        pass
-        #self._push_element('indexterm')
-
-
-    def depart_index(self, node):
-        pass
-        #self._pop_element()
-
+    visit_index = _noop
 
-    def visit_literal_strong(self, node):
-        self._push_element('command')
 
-
-    def depart_literal_strong(self, node):
-        self._pop_element()
+    depart_index = _noop
 
 
     def visit_substitution_definition(self, node):
@@ -621,62 +1052,35 @@ class DocBookTranslator(nodes.NodeVisitor):
         # if sub_text[0:2] == '\\u':
         #     sub_text = '&#%s;' % sub_text[2:]
         # self.subs.append('<!ENTITY %s "%s">' % (sub_name, sub_text))
-        raise nodes.SkipNode
+        return _SKIP_NODE
 
-    def depart_substitution_definition(self, node):
-        pass
+    depart_substitution_definition = _noop
 
     def visit_substitution_reference(self, node):
         #self.tb.data('&%s;' % node))
-        raise nodes.SkipNode
+        return _SKIP_NODE
 
-    def depart_substitution_reference(self, node):
-        pass
-
-
-    def visit_subtitle(self, node):
-        self._push_element('subtitle')
-
-
-    def depart_subtitle(self, node):
-        self._pop_element()
+    depart_substitution_reference = _noop
 
 
     def visit_title(self, node):
-        attribs = {}
-        if "use_xml_id_in_titles" in self._kwargs:
-            if self._kwargs["use_xml_id_in_titles"]:
-                # first check to see if an
-                # {http://www.w3.org/XML/1998/namespace}id was supplied.
-                if len(node['ids']) > 0:
-                    attribs[_NAMESPACE_ID] = node['ids'][0]
-                elif len(node.parent['ids']) > 0:
-                    # If the parent node has an ID, we can use that and add
-                    # '.title' at the end to make a deterministic title ID.
-                    attribs[_NAMESPACE_ID] = f"{node.parent['ids'][0]}.title"
-        self._push_element('title', attribs)
+        if self.use_xml_id_in_titles:
+            # If the parent node has an ID, we can use that and add
+            # '.title' at the end to make a deterministic title ID.
+            parent_ids = node.parent['ids']
+            self._push_with_id(
+                'title',
+                node,
+                f"{parent_ids[0]}.title" if parent_ids else None
+            )
+        else:
+            self._push_element('title')
 
 
     def depart_title(self, node):
         self._pop_element()
 
 
-    def visit_title_reference(self, node):
-        self._push_element('citetitle')
-
-
-    def depart_title_reference(self, node):
-        self._pop_element()
-
-
-    def visit_titleabbrev(self, node):
-        self._push_element('titleabbrev')
-
-
-    def depart_titleabbrev(self, node):
-        self._pop_element()
-
-
     def visit_topic(self, node):
         self.visit_section(node)
 
@@ -690,36 +1094,44 @@ class DocBookTranslator(nodes.NodeVisitor):
     #
 
     def visit_reference(self, node):
-        internal_ref = False
+        attributes = node.attributes
+        refuri = attributes.get('refuri')
 
         # internal ref style #1: it declares itself internal
-        if node.hasattr('internal'):
-            internal_ref = node['internal']
+        internal_ref = attributes.get('internal', False)
 
         # internal ref style #2: it hides as an external ref, with strange
         # qualities.
-        if (node.hasattr('anonymous') and (node['anonymous'] == 1) and
-                node.hasattr('refuri') and (node['refuri'][0] == '_')):
+        if (attributes.get('anonymous') == 1 and refuri is not None and
+                refuri[0] == '_'):
             internal_ref = True
-            node['refuri'] = node['refuri'][1:]
-
-        if node.hasattr('refid'):
-            self._push_element('link', {'linkend': node['refid']})
-        elif node.hasattr('refuri'):
+            refuri = attributes['refuri'] = refuri[1:]
+
+        refid = attributes.get('refid')
+        if refid is not None:
+            self._push_element('link', {'linkend': refid})
+        elif refuri is not None:
+            # The URI comes from the document text, which may hold characters
+            # XML does not allow.
+            refuri = self._sanitize_xml_text(refuri)
             if internal_ref:
-                ref_name = os.path.splitext(node['refuri'])[0]
-                self._push_element('link', {'linkend': ref_name})
+                self._push_element(
+                    'link', {'linkend': _strip_extension(refuri)}
+                )
             else:
                 self._push_element(
                     'link',
-                    {'{http://www.w3.org/1999/xlink}href': node['refuri']}
+                    {'{http://www.w3.org/1999/xlink}href': refuri}
                 )
         else:
             _print_error('unknown reference', node)
+            self._reference_links.append(False)
+            return
+        self._reference_links.append(True)
 
 
     def depart_reference(self, node):
-        if node.hasattr('refid') or node.hasattr('refuri'):
+        if self._reference_links.pop():
             self._pop_element()
 
 
@@ -731,39 +1143,13 @@ class DocBookTranslator(nodes.NodeVisitor):
                 self.next_element_id = node['refid']
 
 
-    def depart_target(self, node):
-        #self._pop_element()
-        pass
+    depart_target = _noop
 
 
     #
     # list parts
     #
 
-    def visit_bullet_list(self, node):
-        self._push_element('itemizedlist')
-
-
-    def depart_bullet_list(self, node):
-        self._pop_element()
-
-
-    def visit_enumerated_list(self, node):
-        self._push_element('orderedlist')
-
-
-    def depart_enumerated_list(self, node):
-        self._pop_element()
-
-
-    def visit_list_item(self, node):
-        self._push_element('listitem')
-
-
-    def depart_list_item(self, node):
-        self._pop_element()
-
-
     def visit_definition_list(self, node):
         # Don't create additional container if we're already in a glossary
         if not self.in_glossary:
@@ -776,16 +1162,10 @@ class DocBookTranslator(nodes.NodeVisitor):
 
 
     def visit_definition_list_item(self, node):
-        attribs = {}
-        
-        # Handle IDs for glossary entries
-        if len(node['ids']) > 0:
-            attribs[_NAMESPACE_ID] = node['ids'][0]
-        
         if self.in_glossary:
-            self._push_element('glossentry', attribs)
+            self._push_with_id('glossentry', node)
         else:
-            self._push_element('varlistentry', attribs)
+            self._push_with_id('varlistentry', node)
 
 
     def depart_definition_list_item(self, node):
@@ -793,16 +1173,10 @@ class DocBookTranslator(nodes.NodeVisitor):
 
 
     def visit_term(self, node):
-        attribs = {}
-        
-        # Handle IDs for glossary terms
-        if len(node['ids']) > 0:
-            attribs[_NAMESPACE_ID] = node['ids'][0]
-            
         if self.in_glossary:
-            self._push_element('glossterm', attribs)
+            self._push_with_id('glossterm', node)
         else:
-            self._push_element('term', attribs)
+            self._push_with_id('term', node)
 
 
     def depart_term(self, node):
@@ -831,41 +1205,42 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()  # info
 
 
-    def visit_field(self, node):
-        pass
+    visit_field = _noop
 
 
-    def depart_field(self, node):
-        pass
+    depart_field = _noop
 
 
     def visit_field_name(self, node):
         name = node.astext()
-        if name == 'author':
-            self._push_element('author')
-            self._push_element('personname')
-        elif name == 'date':
-            self._push_element('pubdate')
+        for tag in self._FIELD_ELEMENTS.get(name, ()):
+            self._push_element(tag)
         self.current_field_name = name
-        raise self.SkipNode
+        return _SKIP_NODE
 
-    def depart_field_name(self, node):
-        pass
+    depart_field_name = _noop
 
     def visit_field_body(self, node):
         if self.current_field_name:
             value = node.astext()
             self.fields[self.current_field_name] = value
+            if (self.current_field_name in self._FIELD_ELEMENTS
+                    and len(node) == 1
+                    and isinstance(node[0], nodes.paragraph)
+                    and len(node[0]) == 1
+                    and isinstance(node[0][0], nodes.Text)):
+                # A body that is plain text needs no walk; bodies with
+                # inline markup are walked to keep it.
+                self.visit_Text(node[0][0])
+                self.depart_field_body(node)
+                return _SKIP_NODE
         else:
             node.clear()
 
     def depart_field_body(self, node):
         if self.current_field_name:
-            if self.current_field_name == 'author':
-                self._pop_element()  # personname
-                self._pop_element()  # author
-            elif self.current_field_name == 'date':
-                self._pop_element()  # pubdate
+            for _ in self._FIELD_ELEMENTS.get(self.current_field_name, ()):
+                self._pop_element()
             self.current_field_name = None
 
     #
@@ -881,25 +1256,24 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._push_element('imageobject')
 
         # Many options are supported for imagedata
+        attributes = node.attributes
         imagedata_attribs = {}
 
-        if node.hasattr('uri'):
-            imagedata_attribs['fileref'] = node['uri']
+        uri = attributes.get('uri')
+        if uri is not None:
+            imagedata_attribs['fileref'] = self._sanitize_xml_text(uri)
         else:
             # unknown attribute - convert to string representation
-            imagedata_attribs['eek'] = str(node)
-
-        if node.hasattr('height'):
-            pass # not in docbook
+            imagedata_attribs['eek'] = self._sanitize_xml_text(node)
 
-        if node.hasattr('width'):
-            pass # not in docbook
+        # height and width are not in docbook
 
-        if node.hasattr('scale'):
-            imagedata_attribs['scale'] = str(node['scale'])
+        scale = attributes.get('scale')
+        if scale is not None:
+            imagedata_attribs['scale'] = str(scale)
 
-        if node.hasattr('align'):
-            alignval = node['align']
+        alignval = attributes.get('align')
+        if alignval is not None:
             if alignval in ['top', 'middle', 'bottom']:
                 # top, middle, bottom all refer to the docbook 'valign'
                 # attribute.
@@ -908,18 +1282,19 @@ class DocBookTranslator(nodes.NodeVisitor):
                 # left, right, center stay as-is
                 imagedata_attribs['align'] = alignval
 
-        if node.hasattr('target'):
+        if 'target' in attributes:
             _print_error('no target attribute supported for images!')
 
         self._push_element('imagedata', imagedata_attribs)
         self._pop_element()
 
         # alt text?
-        if node.hasattr('alt'):
+        alt = attributes.get('alt')
+        if alt is not None:
             self._push_element('textobject')
             self._push_element('phrase')
-            sanitized_alt = self._sanitize_xml_text(node['alt'])
-            self.tb.data(sanitized_alt)
+            sanitized_alt = self._sanitize_xml_text(alt)
+            self._text_buf.append(sanitized_alt)
             self._pop_element() # phrase
             self._pop_element() # textobject
 
@@ -956,14 +1331,6 @@ class DocBookTranslator(nodes.NodeVisitor):
     # table parts
     #
 
-    def visit_table(self, node):
-        self._push_element('table')
-
-
-    def depart_table(self, node):
-        self._pop_element()
-
-
     def visit_tgroup(self, node):
         attribs = {}
 
@@ -990,50 +1357,10 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()
 
 
-    def visit_thead(self, node):
-        self._push_element('thead')
-
-
-    def depart_thead(self, node):
-        self._pop_element()
-
-
-    def visit_row(self, node):
-        self._push_element('row')
-
-
-    def depart_row(self, node):
-        self._pop_element()
-
-
-    def visit_entry(self, node):
-        self._push_element('entry')
-
-
-    def depart_entry(self, node):
-        self._pop_element()
-
-
-    def visit_tbody(self, node):
-        self._push_element('tbody')
-
-
-    def depart_tbody(self, node):
-        self._pop_element()
-
-
     #
     # Character formatting
     #
 
-    def visit_emphasis(self, node):
-        self._push_element('emphasis')
-
-
-    def depart_emphasis(self, node):
-        self._pop_element()
-
-
     def visit_strong(self, node):
         self._push_element('emphasis', {'role': 'strong'})
 
@@ -1042,22 +1369,6 @@ class DocBookTranslator(nodes.NodeVisitor):
         self._pop_element()
 
 
-    def visit_subscript(self, node):
-        self._push_element('subscript')
-
-
-    def depart_subscript(self, node):
-        self._pop_element()
-
-
-    def visit_superscript(self, node):
-        self._push_element('superscript')
-
-
-    def depart_superscript(self, node):
-        self._pop_element()
-
-
     #
     # Code and such
     #
@@ -1066,10 +1377,11 @@ class DocBookTranslator(nodes.NodeVisitor):
         attribs = {}
 
         if node.hasattr('language'):
-            if node.hasattr('classes') and len(node['classes']) > 0:
-                attribs['language'] = node['classes'][1]
+            classes = node.get('classes')
+            if classes:
+                attribs['language'] = self._sanitize_xml_text(classes[1])
             else:
-                attribs['language'] = node['language']
+                attribs['language'] = self._sanitize_xml_text(node['language'])
 
         self._push_element("programlisting", attribs)
         self.in_pre_block = True
@@ -1080,110 +1392,10 @@ class DocBookTranslator(nodes.NodeVisitor):
         self.in_pre_block = False
 
 
-    def visit_literal(self, node):
-        self._push_element('code')
-
-
-    def depart_literal(self, node):
-        self._pop_element()
-
-
-    def visit_inline(self, node):
-        pass
-
-
-    def depart_inline(self, node):
-        pass
-
-    #
-    # Admonitions
-    #
-
-    def visit_admonition(self, node):
-        # generic admonitions will just use the 'note' conventions, but will
-        # set the title.
-        self.visit_note(node)
-
-
-    def depart_admonition(self, node):
-        self.depart_note(node)
-
-
-    def visit_attention(self, node):
-        self.visit_important(node)
-        self._add_element_title('Attention')
-
-
-    def depart_attention(self, node):
-        self.depart_important(node)
-
-
-    def visit_caution(self, node):
-        self._push_element('caution')
-
-
-    def depart_caution(self, node):
-        self._pop_element()
-
-
-    def visit_danger(self, node):
-        self.visit_warning(node)
-        self._add_element_title('Danger')
-
-
-    def depart_danger(self, node):
-        self.depart_warning(node)
-
-
-    def visit_error(self, node):
-        self.visit_important(node)
-        self._add_element_title('Error')
-
-
-    def depart_error(self, node):
-        self.depart_important(node)
-
-
-    def visit_hint(self, node):
-        self.visit_tip(node)
-        self._add_element_title('Hint')
-
-
-    def depart_hint(self, node):
-        self.depart_tip(node)
-
-
-    def visit_important(self, node):
-        self._push_element('important')
+    visit_inline = _noop
 
 
-    def depart_important(self, node):
-        self._pop_element()
-
-
-    def visit_note(self, node):
-        self._push_element('note')
-
-
-    def depart_note(self, node):
-        self._pop_element()
-
-
-    def visit_tip(self, node):
-        self._push_element('tip')
-
-
-    def depart_tip(self, node):
-        self._pop_element()
-
-
-    def visit_warning(self, node):
-        self._push_element('warning')
-
-
-    def depart_warning(self, node):
-        self._pop_element()
-
+    depart_inline = _noop
 
     #
     # Version modification
@@ -1193,23 +1405,17 @@ class DocBookTranslator(nodes.NodeVisitor):
         """Handle Sphinx versionmodified nodes (versionadded, versionchanged, deprecated)."""
         # Use a note element for version information in DocBook
         # We could also use 'remark' for editorial information
-        self._push_element('note')
-        
         # Create a title based on the type and version
         version_type = node.get('type', 'versionmodified')
         version = node.get('version', '')
-        
-        # Map Sphinx version types to readable titles
-        type_labels = {
-            'versionadded': 'New in version',
-            'versionchanged': 'Changed in version', 
-            'deprecated': 'Deprecated since version',
-            'versionremoved': 'Removed in version'
-        }
-        
-        title_text = f"{type_labels.get(version_type, 'Version')} {version}"
-        if title_text.strip():
-            self._add_element_title(title_text)
+        if not version and version_type not in _VERSION_TYPE_LABELS:
+            # Nothing worth a title; keep the content only.
+            self._push_element('note')
+            return
+        self._push_element_with_title(
+            'note',
+            f"{_VERSION_TYPE_LABELS.get(version_type, 'Version')} {version}"
+        )
 
 
     def depart_versionmodified(self, node):
@@ -1221,25 +1427,18 @@ class DocBookTranslator(nodes.NodeVisitor):
 
     def visit_glossary(self, node):
         """Handle Sphinx glossary directive."""
-        attribs = {}
-        
-        # Handle IDs for glossary
-        if self.next_element_id:
-            attribs[_NAMESPACE_ID] = self.next_element_id
-            self.next_element_id = None
-        elif len(node['ids']) > 0:
-            attribs[_NAMESPACE_ID] = node['ids'][0]
-        
         # Set glossary context
         self.in_glossary = True
         
         # Create a glossary element in DocBook
-        self._push_element('glossary', attribs)
+        self._push_with_id('glossary', node)
         
         # Add title if not already present
         # Sphinx glossaries often don't have explicit titles
         # but DocBook glossaries can benefit from one
-        if not any(isinstance(child, nodes.title) for child in node.children):
+        # (a title, if present, is always the first child)
+        children = node.children
+        if not (children and isinstance(children[0], nodes.title)):
             self._add_element_title('Glossary')
 
     def depart_glossary(self, node):
@@ -1251,8 +1450,9 @@ class DocBookTranslator(nodes.NodeVisitor):
     def visit_term_reference(self, node):
         """Handle references to glossary terms."""
         # Create a link to the glossary term
-        if node.hasattr('refid'):
-            self._push_element('glossterm', {'linkend': node['refid']})
+        refid = node.attributes.get('refid')
+        if refid is not None:
+            self._push_element('glossterm', {'linkend': refid})
         else:
             # Fallback to regular emphasis if no reference ID
             self._push_element('glossterm')
@@ -1262,15 +1462,20 @@ class DocBookTranslator(nodes.NodeVisitor):
 
     def visit_pending_xref(self, node):
         """Handle Sphinx cross-references including glossary term references."""
-        reftype = node.get('reftype', '')
-        reftarget = node.get('reftarget', '')
+        attributes = node.attributes
+        reftarget = attributes.get('reftarget')
+        if reftarget:
+            reftarget = self._sanitize_xml_text(reftarget)
+        refid = attributes.get('refid')
         
-        if reftype == 'term' and reftarget:
+        # Term references are rare, so the reference type is only looked at
+        # when there is a target.
+        if reftarget and attributes.get('reftype') == 'term':
             # This is a glossary term reference
             self._push_element('glossterm', {'linkend': reftarget})
-        elif node.get('refid'):
+        elif refid:
             # General cross-reference with ID
-            self._push_element('link', {'linkend': node['refid']})
+            self._push_element('link', {'linkend': refid})
         elif reftarget:
             # Use the target as link reference
             self._push_element('link', {'linkend': reftarget})
@@ -1281,47 +1486,30 @@ class DocBookTranslator(nodes.NodeVisitor):
     def depart_pending_xref(self, node):
         self._pop_element()
 
-    def visit_glossary_see(self, node):
-        """Handle 'see' references in glossary entries."""
-        self._push_element('glosssee')
-
-    def depart_glossary_see(self, node):
-        self._pop_element()
+    # The Sphinx 'only' directive is used for conditional content.
+    # We'll process its content normally for DocBook output.
+    visit_only = _noop
 
-    def visit_glossary_seealso(self, node):
-        """Handle 'see also' references in glossary entries."""
-        self._push_element('glossseealso')
-
-    def depart_glossary_seealso(self, node):
-        self._pop_element()
-
-    def visit_only(self, node):
-        """Handle Sphinx 'only' directive nodes."""
-        # The 'only' directive is used for conditional content
-        # We'll process its content normally for DocBook output
-        pass
-
-    def depart_only(self, node):
-        pass
+    depart_only = _noop
 
     def visit_meta(self, node):
         """Handle meta nodes (usually for HTML metadata)."""
         # Meta nodes are typically for HTML output, skip in DocBook
-        _print_error("ignoring meta node:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring meta node:", node)
+        return _SKIP_NODE
 
-    def depart_meta(self, node):
-        pass
+    depart_meta = _noop
 
     def visit_highlightlang(self, node):
         """Handle highlight language directive."""
         # This directive sets the default highlighting language
         # Skip it as it's handled at a higher level
-        _print_error("ignoring highlightlang directive:", node)
-        raise nodes.SkipNode
+        if _DEBUG:
+            _print_error("ignoring highlightlang directive:", node)
+        return _SKIP_NODE
 
-    def depart_highlightlang(self, node):
-        pass
+    depart_highlightlang = _noop
 
     #
     # TODO support
@@ -1330,10 +1518,13 @@ class DocBookTranslator(nodes.NodeVisitor):
     def visit_todo_node(self, node):
         """Handle Sphinx TODO nodes from sphinx.ext.todo extension."""
         # Use a note element with a distinctive title for TODO items
-        self._push_element('note')
-        
-        # Add a standard "TODO" title 
-        self._add_element_title('TODO')
+        # Add a standard "TODO" title, unless the node brings its own (as
+        # the todo directive does) as the first child.
+        children = node.children
+        if children and isinstance(children[0], nodes.title):
+            self._push_element('note')
+        else:
+            self._push_element_with_title('note', 'TODO')
 
     def depart_todo_node(self, node):
         """Depart TODO node."""
@@ -1344,13 +1535,13 @@ class DocBookTranslator(nodes.NodeVisitor):
     #
 
     def visit_problematic(self, node):
-        _print_error('problematic node', node)
+        if _DEBUG:
+            _print_error('problematic node', node)
 
-    def depart_problematic(self, node):
-        pass
+    depart_problematic = _noop
 
     def visit_system_message(self, node):
-        _print_error('system message', node)
+        if _DEBUG:
+            _print_error('system message', node)
 
-    def depart_system_message(self, node):
-        pass
+    depart_system_message = _noop
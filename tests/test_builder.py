@@ -0,0 +1,95 @@
+"""
+Check that incremental builds only write the documents that are out of date,
+even though unchanged output files keep their old modification times.
+"""
+
+import os
+import time
+
+import pytest
+from sphinx.application import Sphinx
+
+from sphinx_docbook.docbook_builder import DocBookBuilder
+
+
+INDEX = """\
+Index
+=====
+
+The index.
+"""
+
+OTHER = """\
+:orphan:
+
+Other
+=====
+
+Some text.
+"""
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """The names of the documents passed to write_doc."""
+    docnames = []
+    write_doc = DocBookBuilder.write_doc
+
+    def recording_write_doc(self, docname, doctree):
+        docnames.append(docname)
+        write_doc(self, docname, doctree)
+
+    monkeypatch.setattr(DocBookBuilder, 'write_doc', recording_write_doc)
+    return docnames
+
+
+def _build(srcdir, outdir, pretty_print):
+    app = Sphinx(
+        srcdir,
+        srcdir,
+        outdir,
+        os.path.join(outdir, '.doctrees'),
+        'docbook',
+        confoverrides={
+            'extensions': ['sphinx_docbook.docbook_builder'],
+            'docbook_pretty_print': pretty_print,
+        },
+        status=None,
+        warning=None,
+    )
+    app.build()
+
+
+@pytest.mark.parametrize('pretty_print', [True, False])
+def test_incremental_build(tmp_path, written, pretty_print):
+    srcdir = tmp_path / 'source'
+    outdir = tmp_path / 'build'
+    srcdir.mkdir()
+    (srcdir / 'conf.py').write_text('')
+    (srcdir / 'index.rst').write_text(INDEX)
+    (srcdir / 'other.rst').write_text(OTHER)
+
+    def build():
+        written.clear()
+        _build(str(srcdir), str(outdir), pretty_print)
+        return sorted(written)
+
+    assert build() == ['index', 'other']
+    assert build() == []
+
+    # A newer source is read and written again. Its output does not change,
+    # so the output file keeps its old modification time...
+    target = outdir / 'other.xml'
+    target_mtime = target.stat().st_mtime_ns - 10 ** 10
+    os.utime(target, ns=(target_mtime, target_mtime))
+    source_mtime = time.time_ns()
+    os.utime(srcdir / 'other.rst', ns=(source_mtime, source_mtime))
+    assert build() == ['other']
+    assert target.stat().st_mtime_ns == target_mtime
+
+    # ...but the document is not written once more in the next build.
+    assert build() == []
+
+    target.unlink()
+    assert build() == ['other']
+    assert target.is_file()
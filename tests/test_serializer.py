@@ -0,0 +1,144 @@
+"""
+Check that DocBook output serialized while translating is the same as lxml's
+serialization of the in-memory DocBook tree.
+"""
+
+import io
+
+import pytest
+from docutils.core import publish_doctree
+
+from sphinx_docbook.docbook_writer import DocBookWriter
+
+
+SOURCES = {
+    'sections': """\
+Document Title
+==============
+
+Intro with *emphasis*, **strong** and ``literal`` text.
+
+Section One
+-----------
+
+* item one
+* item two
+
+  1. nested
+  2. list
+
+Section Two
+-----------
+
+Last paragraph.
+""",
+    'escaping': """\
+Escaping
+========
+
+Text with <angle brackets>, ampersands & "quotes" and 'apostrophes'.
+
+A `link <https://example.com/?a=1&b="2"&c=<3>>`_ with special characters.
+
+::
+
+    if a < b && c > d:
+        print("done")
+""",
+    'non_ascii': """\
+Ünïcödé
+=======
+
+Café, naïve, 日本語, and a dash — here.
+""",
+    'invalid_chars': (
+        "Invalid\n=======\n\n"
+        "Control \x01 and non-characters \ufffe\uffff are dropped.\n"
+    ),
+    'empty_elements': """\
+Images
+======
+
+.. image:: picture.png
+   :alt: An "alt" text
+   :scale: 50
+   :align: center
+
+.. figure:: other.png
+
+   A caption.
+""",
+    'table': """\
+Table
+=====
+
+=====  =====
+A      B
+=====  =====
+1      2
+3
+=====  =====
+""",
+    'several_roots': """\
+First paragraph, without a title.
+
+Second *paragraph*, also without one.
+""",
+}
+
+
+class _UnseekableOutput(io.RawIOBase):
+    """A binary output that cannot seek, like a pipe."""
+
+    def __init__(self):
+        super().__init__()
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def _translate(doctree, output_xml_header, stream=None, pretty_print=False):
+    writer = DocBookWriter(
+        'section',
+        document_id='test',
+        output_xml_header=output_xml_header,
+        stream=stream,
+        pretty_print=pretty_print,
+    )
+    writer.document = doctree
+    writer.translate()
+    return writer.output
+
+
+@pytest.mark.parametrize('output_xml_header', [True, False])
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_streamed_output_matches_lxml(name, output_xml_header):
+    doctree = publish_doctree(
+        SOURCES[name], settings_overrides={'report_level': 5}
+    )
+    expected = _translate(doctree, output_xml_header)
+
+    seekable = io.BytesIO()
+    assert _translate(doctree, output_xml_header, seekable) is None
+    assert seekable.getvalue() == expected
+
+    unseekable = _UnseekableOutput()
+    _translate(doctree, output_xml_header, unseekable)
+    assert bytes(unseekable.data) == expected
+
+
+@pytest.mark.parametrize('output_xml_header', [True, False])
+def test_pretty_output_written_to_stream(output_xml_header):
+    doctree = publish_doctree(
+        SOURCES['sections'], settings_overrides={'report_level': 5}
+    )
+    expected = _translate(doctree, output_xml_header, pretty_print=True)
+
+    stream = io.BytesIO()
+    assert _translate(doctree, output_xml_header, stream, True) is None
+    assert stream.getvalue() == expected
@@ -0,0 +1,63 @@
+"""
+Check details of the DocBook translation.
+"""
+
+import posixpath
+
+import pytest
+from docutils.core import publish_doctree
+
+from sphinx_docbook.docbook_writer import DocBookWriter, _strip_extension
+
+
+def _translate(source):
+    doctree = publish_doctree(source, settings_overrides={
+        'report_level': 5,
+        'docinfo_xform': False,
+        'doctitle_xform': False,
+    })
+    writer = DocBookWriter(
+        'section',
+        document_id='test',
+        output_xml_header=False,
+        pretty_print=False,
+    )
+    writer.document = doctree
+    writer.translate()
+    return writer.output.decode('utf-8'), writer.fields
+
+
+def test_info_fields():
+    output, fields = _translate("""\
+Title
+=====
+
+:author: *Jane* Doe
+:date: 2020-01-01
+
+Text.
+""")
+    assert (
+        '<info><author><personname><emphasis>Jane</emphasis> Doe</personname>'
+        '</author><pubdate>2020-01-01</pubdate></info>'
+    ) in output
+    assert fields == {'author': 'Jane Doe', 'date': '2020-01-01'}
+
+
+@pytest.mark.parametrize('uri', [
+    'page', 'page.xml', 'dir/page.xml', './page.xml#anchor', 'a.b.c',
+    'dir.d/page', 'page.', '.foo', '..foo', '.foo.xml', '...', 'dir/.foo',
+    'dir/..foo.xml', '../page.xml', '', '/', '.',
+])
+def test_strip_extension(uri):
+    assert _strip_extension(uri) == posixpath.splitext(uri)[0]
+
+
+def test_invalid_characters_in_attributes():
+    output, _ = _translate(
+        "Title\n=====\n\n"
+        "A `link <https://example.com/a\x01b>`_.\n\n"
+        ".. image:: pic\x02ture.png\n"
+    )
+    assert 'xlink:href="https://example.com/ab"' in output
+    assert 'fileref="picture.png"' in output